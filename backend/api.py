@@ -1,4 +1,5 @@
-from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, HTTPException, Query, WebSocket, WebSocketDisconnect
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional
 import psycopg2
@@ -6,7 +7,19 @@ from psycopg2 import pool
 import os
 from dotenv import load_dotenv
 from fastapi.middleware.cors import CORSMiddleware
+from collections import deque
+from contextlib import asynccontextmanager
+from datetime import date, timedelta
 import asyncio
+import ipaddress
+import json
+import re
+import threading
+import time
+import numpy as np
+
+from broadcast import get_backplane
+from recent_events import RecentEvents
 
 # Load environment variables from .env
 load_dotenv()
@@ -18,13 +31,113 @@ DB_CONFIG = {
     "password": os.getenv("POSTGRES_PASSWORD"),
     "host": "timescaledb",
     "port": 5432,
+    "connect_timeout": 5,
 }
 
-# Create a connection pool (adjust minconn and maxconn as needed)
-db_pool = pool.ThreadedConnectionPool(minconn=1, maxconn=10, **DB_CONFIG)
+# Connection budget is shared by all uvicorn workers (uvicorn reads WEB_CONCURRENCY
+# for --workers), so each worker's pool gets an equal slice of it.
+WORKERS = int(os.getenv("WEB_CONCURRENCY", "1"))
+DB_MAX_CONNECTIONS = int(os.getenv("DB_MAX_CONNECTIONS", "10"))
+POOL_MAXCONN = max(2, DB_MAX_CONNECTIONS // WORKERS)
+POOL_MINCONN = min(int(os.getenv("DB_MIN_CONNECTIONS", "2")), POOL_MAXCONN)  # opened up front by the warm-up
+
+# Startup warm-up: connect with retry, then pre-fill caches before reporting ready
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "1") == "1"
+DB_CONNECT_RETRY_MAX_DELAY = 30  # seconds, cap for the exponential backoff
+
+class PreparedConnectionPool(pool.ThreadedConnectionPool):
+    """Thread-safe pool that prepares the hot statements on every new connection."""
+
+    def _connect(self, key=None):
+        conn = super()._connect(key)
+        cursor = conn.cursor()
+        for name, statement in PREPARED_STATEMENTS.items():
+            cursor.execute(f"PREPARE {name} AS {statement}")
+        cursor.close()
+        conn.commit()
+        return conn
+
+class LazyPool:
+    """
+    Create the connection pool on first use instead of at import time.
+
+    Importing the app no longer needs a reachable database; until the pool
+    exists, getconn() tries to create it and raises if the DB is down.
+    """
+
+    def __init__(self):
+        self.pool = None
+        self.lock = threading.Lock()
+
+    def get(self):
+        if self.pool is None:
+            with self.lock:
+                if self.pool is None:
+                    self.pool = PreparedConnectionPool(minconn=1, maxconn=POOL_MAXCONN, **DB_CONFIG)
+        return self.pool
+
+    @property
+    def ready(self) -> bool:
+        return self.pool is not None
+
+    def getconn(self):
+        return self.get().getconn()
+
+    def putconn(self, conn, close=False):
+        self.get().putconn(conn, close=close)
+
+    def closeall(self):
+        if self.pool is not None and not self.pool.closed:
+            self.pool.closeall()
+
+# Connection pool sized for this worker, created lazily
+db_pool = LazyPool()
+
+# Pub/sub backplane for WebSocket broadcasts (redis://... when running several workers)
+BROADCAST_URL = os.getenv("BROADCAST_URL", "memory://")
+MAPLOGS_CHANNEL = "maplogs"  # messages forwarded as-is to WebSocket clients
+EVENTS_CHANNEL = "events"  # newly inserted rows, applied to every worker's recent events
+MAPLOGS_POLL_INTERVAL = 5  # seconds between checks for new map logs
+
+# Per-client WebSocket delivery
+WS_HEARTBEAT_INTERVAL = 25  # seconds of silence before a ping is sent
+WS_MIN_SEND_INTERVAL = 1  # seconds between updates to one client; bursts in between are coalesced
+WS_MAX_PENDING_MESSAGES = 50  # queued alerts per client; the oldest are dropped for slow consumers
+WS_MAX_DELTA_ROWS = 500  # rows per delta message
+backplane = get_backplane(BROADCAST_URL)
+
+# Parquet files written by scripts/archive_failed_logins.py, partitioned as day=YYYY-MM-DD
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "/archive")
+ARCHIVE_FILE_PATTERN = re.compile(r"^part-\d+-\d+\.parquet$")
+
+# In-memory copy of the newest rows, serving /maplogs/, the WebSocket and recent /logs/ pages
+RECENT_EVENTS_CAPACITY = int(os.getenv("RECENT_EVENTS_CAPACITY", "50000"))
+recent_events = RecentEvents(RECENT_EVENTS_CAPACITY)
+
+# Readiness state reported by /readyz
+startup_state = {"database": False, "warm": False, "error": None}
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Connect the backplane, warm up in the background and run the relay/publisher tasks."""
+    await backplane.connect()
+    tasks = [
+        asyncio.create_task(warm_up()),
+        asyncio.create_task(relay_broadcasts()),
+        asyncio.create_task(apply_new_events()),
+        asyncio.create_task(publish_new_events()),
+    ]
+    try:
+        yield
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await backplane.disconnect()
+        db_pool.closeall()
 
 # FastAPI instance
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -48,30 +161,110 @@ class AttackLog(BaseModel):
     latitude: Optional[float] = None
     longitude: Optional[float] = None
 
+# WebSocket subscriber state
+def is_integer(value) -> bool:
+    """True for JSON integers; bool is an int subclass but not a row id or port."""
+    return isinstance(value, int) and not isinstance(value, bool)
+
+class Subscriber:
+    """
+    One WebSocket client.
+
+    Until the client sends a subscribe message it gets the legacy full map
+    snapshot whenever the map changes. After subscribing it only gets rows
+    newer than its cursor that match its filters.
+    """
+
+    def __init__(self, websocket: WebSocket):
+        self.websocket = websocket
+        self.subscribed = False
+        self.cursor = 0  # id of the newest row already sent
+        self.countries = None
+        self.ports = None
+        self.bbox = None  # (south, west, north, east)
+        self.last_snapshot_key = None
+        self.pending = deque(maxlen=WS_MAX_PENDING_MESSAGES)
+        self.wakeup = asyncio.Event()
+        self.wakeup.set()  # send the initial snapshot straight away
+
+    def subscribe(self, message: dict):
+        """Apply a {"type": "subscribe", "filters": {...}, "cursor": id} message."""
+        filters = message.get("filters") or {}
+        if not isinstance(filters, dict):
+            raise ValueError("filters must be an object")
+        countries = filters.get("country")
+        ports = filters.get("port")
+        bbox = filters.get("bbox")
+        if isinstance(countries, str):
+            countries = [countries]
+        if is_integer(ports):
+            ports = [ports]
+        if countries is not None and not (
+            isinstance(countries, list) and all(isinstance(v, str) for v in countries)
+        ):
+            raise ValueError("country must be a string or a list of strings")
+        if ports is not None and not (isinstance(ports, list) and all(is_integer(v) for v in ports)):
+            raise ValueError("port must be an integer or a list of integers")
+        if bbox is not None:
+            if (
+                not isinstance(bbox, list)
+                or len(bbox) != 4
+                or not all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in bbox)
+            ):
+                raise ValueError("bbox must be [south, west, north, east]")
+            bbox = tuple(bbox)
+        cursor = message.get("cursor")
+        latest_id = recent_events.latest_id
+        if cursor is not None and not (is_integer(cursor) and 0 <= cursor <= latest_id):
+            raise ValueError(f"cursor must be a row id between 0 and {latest_id}")
+
+        self.countries = set(countries) if countries else None
+        self.ports = {int(port) for port in ports} if ports else None
+        self.bbox = bbox
+        # Without a cursor the client only wants what happens from now on.
+        self.cursor = cursor if cursor is not None else latest_id
+        self.subscribed = True
+        self.wakeup.set()
+
+    def matches(self, row) -> bool:
+        """Check an (ip, timestamp, port, city, region, country, lat, lon) row against the filters."""
+        if self.countries is not None and row[5] not in self.countries:
+            return False
+        if self.ports is not None and row[2] not in self.ports:
+            return False
+        if self.bbox is not None:
+            south, west, north, east = self.bbox
+            if row[6] is None or row[7] is None:
+                return False
+            if not (south <= row[6] <= north and west <= row[7] <= east):
+                return False
+        return True
+
 # WebSocket connection manager
 class ConnectionManager:
     def __init__(self):
-        self.active_connections: List[WebSocket] = []
+        self.subscribers: List[Subscriber] = []
 
-    async def connect(self, websocket: WebSocket):
+    async def connect(self, websocket: WebSocket) -> Subscriber:
         await websocket.accept()
-        self.active_connections.append(websocket)
+        subscriber = Subscriber(websocket)
+        self.subscribers.append(subscriber)
+        return subscriber
 
-    def disconnect(self, websocket: WebSocket):
-        if websocket in self.active_connections:
-            self.active_connections.remove(websocket)
+    def disconnect(self, subscriber: Subscriber):
+        if subscriber in self.subscribers:
+            self.subscribers.remove(subscriber)
 
     async def send_data(self, data: dict):
-        to_remove = []
-        for connection in self.active_connections:
-            try:
-                await connection.send_json(data)
-            except Exception as e:
-                print(f"Error sending data to client: {e}")
-                to_remove.append(connection)
-        # Remove disconnected clients
-        for connection in to_remove:
-            self.disconnect(connection)
+        """Queue a message for every client; each client's sender delivers it."""
+        for subscriber in self.subscribers:
+            subscriber.pending.append(data)
+            subscriber.wakeup.set()
+
+    def notify_new_events(self):
+        """Wake every client's sender; it works out what that client is missing."""
+        for subscriber in self.subscribers:
+            subscriber.wakeup.set()
 
 manager = ConnectionManager()
 
@@ -80,17 +273,60 @@ def read_root():
     """Root endpoint."""
     return {"message": "Welcome to the Server Attack Map API"}
 
+@app.get("/healthz")
+def healthz():
+    """Liveness: the process is up and serving requests."""
+    return {"status": "ok"}
+
+@app.get("/readyz")
+def readyz():
+    """Readiness: the database pool exists and the warm-up has finished."""
+    ready = startup_state["database"] and startup_state["warm"]
+    return JSONResponse(
+        {"status": "ready" if ready else "starting", **startup_state},
+        status_code=200 if ready else 503,
+    )
+
+def parse_cidr(cidr: str) -> str:
+    """Validate an IPv4/IPv6 network such as 203.0.113.0/24 or 2001:db8::/48."""
+    try:
+        return str(ipaddress.ip_network(cidr, strict=False))
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid CIDR: {cidr}")
+
+LOGS_MAX_LIMIT = 10000  # rows per /logs/ page
+
 @app.get("/logs/", response_model=List[AttackLog])
-def read_logs():
-    """Fetch all logs from the database."""
+def read_logs(
+    limit: Optional[int] = Query(None, ge=0, le=LOGS_MAX_LIMIT),
+    offset: int = Query(0, ge=0),
+    cidr: Optional[str] = None,
+):
+    """
+    Fetch logs from the database, newest first. Recent pages are served from memory.
+
+    Pages (`limit`/`offset`) are ordered by id, the order the in-memory buffer
+    keeps, so paging across both sources neither repeats nor skips rows.
+    `cidr` restricts results to addresses inside a network (GiST index containment).
+    """
+    if cidr is not None:
+        cidr = parse_cidr(cidr)
+    elif limit is not None:
+        rows = recent_events.latest_rows(limit, offset)
+        if rows is not None:
+            return JSONResponse([row_to_log(row) for row in rows])
+
+    order_by = "id DESC" if limit is not None else "timestamp DESC"
     conn = db_pool.getconn()
     try:
         cursor = conn.cursor()
-        cursor.execute("""
+        cursor.execute(f"""
             SELECT ip_address, timestamp, port, city, region, country, latitude, longitude
             FROM failed_logins
-            ORDER BY timestamp DESC;
-        """)
+            WHERE %(cidr)s::inet IS NULL OR ip_address <<= %(cidr)s::inet
+            ORDER BY {order_by}
+            LIMIT %(limit)s OFFSET %(offset)s;
+        """, {"cidr": cidr, "limit": limit, "offset": offset})
         rows = cursor.fetchall()
         logs = [
             AttackLog(
@@ -112,53 +348,112 @@ def read_logs():
     finally:
         db_pool.putconn(conn)
 
-@app.get("/maplogs/", response_model=List[AttackLog])
-def read_map_logs():
-    """Fetch last 100 logs with max 2 repeating cities."""
+MAP_LOGS_QUERY = """
+    WITH ranked_entries AS (
+        SELECT 
+            ip_address, 
+            timestamp, 
+            port, 
+            city, 
+            region, 
+            country, 
+            latitude, 
+            longitude,
+            ROW_NUMBER() OVER (PARTITION BY city ORDER BY timestamp DESC) AS rank
+        FROM failed_logins
+        WHERE city IS NOT NULL
+    )
+    SELECT ip_address, timestamp, port, city, region, country, latitude, longitude
+    FROM ranked_entries
+    WHERE rank <= 2
+    ORDER BY timestamp DESC
+    LIMIT 100;
+"""
+
+def fetch_map_rows():
+    """Run the map snapshot query and return the raw rows."""
     conn = db_pool.getconn()
     try:
         cursor = conn.cursor()
-        cursor.execute("""
-            WITH ranked_entries AS (
-                SELECT 
-                    ip_address, 
-                    timestamp, 
-                    port, 
-                    city, 
-                    region, 
-                    country, 
-                    latitude, 
-                    longitude,
-                    ROW_NUMBER() OVER (PARTITION BY city ORDER BY timestamp DESC) AS rank
-                FROM failed_logins
-                WHERE city IS NOT NULL
-            )
-            SELECT ip_address, timestamp, port, city, region, country, latitude, longitude
-            FROM ranked_entries
-            WHERE rank <= 2
-            ORDER BY timestamp DESC
-            LIMIT 100;
-        """)
+        cursor.execute("EXECUTE map_logs;")
+        rows = cursor.fetchall()
+        cursor.close()
+        return rows
+    finally:
+        db_pool.putconn(conn)
+
+def row_to_log(row) -> dict:
+    """Convert a (ip, timestamp, port, city, region, country, lat, lon) row to a log dict."""
+    return {
+        "ip_address": row[0],
+        "timestamp": row[1].strftime("%Y-%m-%d %H:%M:%S"),
+        "port": row[2],
+        "city": row[3],
+        "region": row[4],
+        "country": row[5],
+        "latitude": row[6],
+        "longitude": row[7],
+    }
+
+# Columns in the order RecentEvents.append() takes them
+EVENT_COLUMNS = "id, timestamp, ip_address, port, city, region, country, latitude, longitude"
+
+def load_recent_events():
+    """(Re)fill the in-memory recent events from the newest rows in the table."""
+    conn = db_pool.getconn()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            SELECT {EVENT_COLUMNS}
+            FROM failed_logins
+            ORDER BY id DESC
+            LIMIT %s;
+        """, (RECENT_EVENTS_CAPACITY,))
         rows = cursor.fetchall()
-        maplogs = [
-            AttackLog(
-                ip_address=row[0],
-                timestamp=row[1].strftime("%Y-%m-%d %H:%M:%S"),
-                port=row[2],
-                city=row[3],
-                region=row[4],
-                country=row[5],
-                latitude=row[6],
-                longitude=row[7],
-            )
-            for row in rows
-        ]
         cursor.close()
-        return maplogs
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error fetching map logs: {e}")
     finally:
         db_pool.putconn(conn)
+    rows.reverse()
+    recent_events.load(rows, complete=len(rows) < RECENT_EVENTS_CAPACITY)
+
+def fetch_events_since(after_id: int):
+    """Fetch rows inserted after after_id, oldest first."""
+    conn = db_pool.getconn()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("EXECUTE events_since(%s, %s);", (after_id, RECENT_EVENTS_CAPACITY))
+        rows = cursor.fetchall()
+        cursor.close()
+        return rows
+    finally:
+        db_pool.putconn(conn)
+
+# Hot statements prepared once per connection (see PreparedConnectionPool)
+PREPARED_STATEMENTS = {
+    "map_logs": MAP_LOGS_QUERY,
+    "events_since": f"""
+        SELECT {EVENT_COLUMNS}
+        FROM failed_logins
+        WHERE id > $1
+        ORDER BY id
+        LIMIT $2
+    """,
+}
+
+def current_map_rows():
+    """Map snapshot rows, from memory when possible."""
+    rows = recent_events.map_rows()
+    if rows is None:
+        rows = fetch_map_rows()
+    return rows
+
+@app.get("/maplogs/", response_model=List[AttackLog])
+def read_map_logs():
+    """Fetch last 100 logs with max 2 repeating cities."""
+    try:
+        return JSONResponse([row_to_log(row) for row in current_map_rows()])
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching map logs: {e}")
 
 @app.get("/charts/top-countries/")
 def top_attack_sources(limit: int = 10):
@@ -167,8 +462,8 @@ def top_attack_sources(limit: int = 10):
     try:
         cursor = conn.cursor()
         cursor.execute("""
-            SELECT country, COUNT(*) AS count
-            FROM failed_logins
+            SELECT country, SUM(attempts)::bigint AS count
+            FROM attack_counts
             GROUP BY country
             ORDER BY count DESC
             LIMIT %s;
@@ -181,6 +476,43 @@ def top_attack_sources(limit: int = 10):
     finally:
         db_pool.putconn(conn)
 
+@app.get("/charts/top-subnets/")
+def top_attack_subnets(
+    limit: int = Query(10, ge=1, le=100),
+    v4_prefix: int = 24,
+    v6_prefix: int = 48,
+    cidr: Optional[str] = None,
+):
+    """Fetch top attacking subnets (/24 for IPv4, /48 for IPv6 by default), optionally within cidr."""
+    if not (0 <= v4_prefix <= 32 and 0 <= v6_prefix <= 128):
+        raise HTTPException(status_code=400, detail="Invalid prefix length")
+    if cidr is not None:
+        cidr = parse_cidr(cidr)
+
+    conn = db_pool.getconn()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT network(set_masklen(
+                       ip_address,
+                       CASE WHEN family(ip_address) = 4 THEN %(v4_prefix)s ELSE %(v6_prefix)s END
+                   )) AS subnet,
+                   SUM(COALESCE(attempts, 1))::bigint AS count,
+                   COUNT(DISTINCT ip_address) AS addresses
+            FROM failed_logins
+            WHERE %(cidr)s::inet IS NULL OR ip_address <<= %(cidr)s::inet
+            GROUP BY subnet
+            ORDER BY count DESC
+            LIMIT %(limit)s;
+        """, {"v4_prefix": v4_prefix, "v6_prefix": v6_prefix, "cidr": cidr, "limit": limit})
+        rows = cursor.fetchall()
+        cursor.close()
+        return [{"subnet": row[0], "count": row[1], "addresses": row[2]} for row in rows]
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching top attack subnets: {e}")
+    finally:
+        db_pool.putconn(conn)
+
 @app.get("/charts/attack-trends/")
 def attack_trends():
     """Fetch attack trends over time."""
@@ -188,8 +520,8 @@ def attack_trends():
     try:
         cursor = conn.cursor()
         cursor.execute("""
-            SELECT DATE(timestamp) AS attack_date, COUNT(*) AS count
-            FROM failed_logins
+            SELECT DATE(bucket) AS attack_date, SUM(attempts)::bigint AS count
+            FROM attack_counts
             GROUP BY attack_date
             ORDER BY attack_date;
         """)
@@ -208,8 +540,8 @@ def attack_distribution_by_time():
     try:
         cursor = conn.cursor()
         cursor.execute("""
-            SELECT EXTRACT(HOUR FROM timestamp) AS hour, COUNT(*) AS count
-            FROM failed_logins
+            SELECT EXTRACT(HOUR FROM bucket) AS hour, SUM(attempts)::bigint AS count
+            FROM attack_counts
             GROUP BY hour
             ORDER BY hour;
         """)
@@ -223,13 +555,146 @@ def attack_distribution_by_time():
     finally:
         db_pool.putconn(conn)
 
+# Heatmap results are cached per (kind, params) for this many seconds
+HEATMAP_CACHE_TTL = int(os.getenv("HEATMAP_CACHE_TTL", "60"))
+HEATMAP_CACHE_MAX_ENTRIES = 64
+heatmap_cache = {}  # (kind, days, limit) -> (expires_at, result), oldest first
+heatmap_cache_lock = threading.Lock()  # endpoints run concurrently in the threadpool
+HEATMAP_DEFAULT_DAYS = 30
+HEATMAP_DEFAULT_LIMIT = 20
+
+WEEKDAYS = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+
+# Each heatmap is one grouped pass over the hourly attack_counts view (hot rows
+# plus archived rollups), returning (row_key, column_key, count) cells.
+HEATMAP_QUERIES = {
+    "hour-weekday": """
+        SELECT EXTRACT(ISODOW FROM bucket)::int - 1 AS weekday,
+               EXTRACT(HOUR FROM bucket)::int AS hour,
+               SUM(attempts)::bigint AS count
+        FROM attack_counts
+        WHERE bucket >= NOW() - make_interval(days => %(days)s)
+        GROUP BY weekday, hour;
+    """,
+    "country-hour": """
+        SELECT COALESCE(country, 'Unknown') AS country,
+               EXTRACT(HOUR FROM bucket)::int AS hour,
+               SUM(attempts)::bigint AS count
+        FROM attack_counts
+        WHERE bucket >= NOW() - make_interval(days => %(days)s)
+        GROUP BY 1, hour;
+    """,
+    "port-day": """
+        SELECT port, DATE(bucket) AS day, SUM(attempts)::bigint AS count
+        FROM attack_counts
+        WHERE bucket >= CURRENT_DATE - make_interval(days => %(days)s - 1)
+        GROUP BY port, day;
+    """,
+}
+
+def dense_matrix(cells, row_labels, column_labels):
+    """Scatter (row_key, column_key, count) cells into a rows x columns count matrix."""
+    row_index = {label: i for i, label in enumerate(row_labels)}
+    column_index = {label: i for i, label in enumerate(column_labels)}
+    cells = [(row_index[r], column_index[c], n) for r, c, n in cells if r in row_index and c in column_index]
+    matrix = np.zeros((len(row_labels), len(column_labels)), dtype=np.int64)
+    if cells:
+        rows, columns, counts = np.array(cells, dtype=np.int64).T
+        np.add.at(matrix, (rows, columns), counts)
+    return matrix
+
+def top_labels(cells, limit):
+    """Row keys ordered by their total count, keeping the top limit."""
+    totals = {}
+    for row_key, _, count in cells:
+        totals[row_key] = totals.get(row_key, 0) + count
+    return sorted(totals, key=totals.get, reverse=True)[:limit]
+
+def compute_heatmap(kind: str, days: int, limit: int) -> dict:
+    conn = db_pool.getconn()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(HEATMAP_QUERIES[kind], {"days": days})
+        cells = cursor.fetchall()
+        # Day columns must match DATE(bucket), which uses the session's timezone.
+        cursor.execute("SELECT CURRENT_DATE;")
+        today = cursor.fetchone()[0]
+        cursor.close()
+    finally:
+        db_pool.putconn(conn)
+
+    if kind == "hour-weekday":
+        row_keys, column_keys = list(range(7)), list(range(24))
+        rows, columns = WEEKDAYS, [f"{hour}:00" for hour in range(24)]
+    elif kind == "country-hour":
+        row_keys, column_keys = top_labels(cells, limit), list(range(24))
+        rows, columns = row_keys, [f"{hour}:00" for hour in range(24)]
+    else:
+        first_day = today - timedelta(days=days - 1)
+        row_keys = top_labels(cells, limit)
+        column_keys = [first_day + timedelta(days=i) for i in range(days)]
+        rows, columns = row_keys, [str(day) for day in column_keys]
+
+    matrix = dense_matrix(cells, row_keys, column_keys)
+    return {
+        "kind": kind,
+        "rows": rows,
+        "columns": columns,
+        "values": matrix.tolist(),
+        "row_totals": matrix.sum(axis=1).tolist(),
+        "column_totals": matrix.sum(axis=0).tolist(),
+    }
+
+def store_heatmap(key, result):
+    """Cache a heatmap, dropping expired entries and then the oldest past the size cap."""
+    now = time.monotonic()
+    with heatmap_cache_lock:
+        for stale in [k for k, (expires_at, _) in heatmap_cache.items() if expires_at <= now]:
+            del heatmap_cache[stale]
+        heatmap_cache.pop(key, None)
+        while len(heatmap_cache) >= HEATMAP_CACHE_MAX_ENTRIES:
+            del heatmap_cache[next(iter(heatmap_cache))]
+        heatmap_cache[key] = (now + HEATMAP_CACHE_TTL, result)
+
+@app.get("/charts/heatmap/{kind}")
+def attack_heatmap(
+    kind: str,
+    days: int = HEATMAP_DEFAULT_DAYS,
+    limit: int = Query(HEATMAP_DEFAULT_LIMIT, ge=1, le=100),
+):
+    """
+    Fetch a dense count matrix for hour-weekday, country-hour or port-day.
+
+    Country and port rows are the top `limit` by total count over the last `days` days.
+    """
+    if kind not in HEATMAP_QUERIES:
+        raise HTTPException(status_code=404, detail=f"Unknown heatmap: {kind}")
+    if not 1 <= days <= 366:
+        raise HTTPException(status_code=400, detail="days must be between 1 and 366")
+
+    key = (kind, days, limit)
+    with heatmap_cache_lock:
+        cached = heatmap_cache.get(key)
+    if cached and cached[0] > time.monotonic():
+        return cached[1]
+    try:
+        result = compute_heatmap(kind, days, limit)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching {kind} heatmap: {e}")
+    store_heatmap(key, result)
+    return result
+
 @app.get("/logs/count/")
 def get_log_count():
     """Get the total number of log entries."""
     conn = db_pool.getconn()
     try:
         cursor = conn.cursor()
-        cursor.execute("SELECT COUNT(*) FROM failed_logins;")
+        # Hot rows plus rows already moved to the archive
+        cursor.execute("""
+            SELECT (SELECT COALESCE(SUM(COALESCE(attempts, 1)), 0) FROM failed_logins)
+                 + (SELECT COALESCE(SUM(attempts), 0) FROM failed_logins_rollup);
+        """)
         count = cursor.fetchone()[0]
         cursor.close()
         return {"count": count}
@@ -238,6 +703,99 @@ def get_log_count():
     finally:
         db_pool.putconn(conn)
 
+def archive_paths():
+    """Paths of every finished archive file, skipping temp files and anything else."""
+    paths = []
+    for entry in sorted(os.listdir(ARCHIVE_DIR)):
+        path = os.path.join(ARCHIVE_DIR, entry)
+        if entry.startswith("day=") and os.path.isdir(path):
+            paths.extend(
+                os.path.join(path, name)
+                for name in sorted(os.listdir(path))
+                if ARCHIVE_FILE_PATTERN.match(name)
+            )
+    return paths
+
+@app.get("/export/")
+def list_archives():
+    """List archived day partitions and their Parquet files."""
+    if not os.path.isdir(ARCHIVE_DIR):
+        return []
+    partitions = []
+    for entry in sorted(os.listdir(ARCHIVE_DIR)):
+        path = os.path.join(ARCHIVE_DIR, entry)
+        if not entry.startswith("day=") or not os.path.isdir(path):
+            continue
+        files = sorted(name for name in os.listdir(path) if ARCHIVE_FILE_PATTERN.match(name))
+        partitions.append({
+            "day": entry[len("day="):],
+            "files": files,
+            "bytes": sum(os.path.getsize(os.path.join(path, name)) for name in files),
+        })
+    return partitions
+
+@app.get("/export/query")
+def query_archives(
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    country: Optional[str] = None,
+    port: Optional[int] = None,
+    limit: Optional[int] = Query(None, ge=0),
+):
+    """
+    Stream archived rows as newline-delimited JSON without touching Postgres.
+
+    Only the day partitions between start and end (inclusive) are read, and
+    rows are decoded one record batch at a time.
+    """
+    paths = archive_paths() if os.path.isdir(ARCHIVE_DIR) else []
+    if not paths:
+        raise HTTPException(status_code=404, detail="No archives available")
+    # Imported here so pyarrow doesn't slow down API startup
+    import pyarrow.dataset as ds
+
+    dataset = ds.dataset(paths, format="parquet", partitioning="hive", partition_base_dir=ARCHIVE_DIR)
+    conditions = []
+    if start is not None:
+        conditions.append(ds.field("day") >= start.isoformat())
+    if end is not None:
+        conditions.append(ds.field("day") <= end.isoformat())
+    if country is not None:
+        conditions.append(ds.field("country") == country)
+    if port is not None:
+        conditions.append(ds.field("port") == port)
+    expression = None
+    for condition in conditions:
+        expression = condition if expression is None else expression & condition
+
+    def generate():
+        remaining = limit
+        for batch in dataset.to_batches(filter=expression):
+            rows = batch.to_pylist()
+            if remaining is not None:
+                rows = rows[:remaining]
+                remaining -= len(rows)
+            for row in rows:
+                yield json.dumps(row, default=str) + "\n"
+            if remaining == 0:
+                return
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+@app.get("/export/{day}/{filename}")
+def download_archive(day: date, filename: str):
+    """Download one archived Parquet file."""
+    if not ARCHIVE_FILE_PATTERN.match(filename):
+        raise HTTPException(status_code=404, detail="Archive not found")
+    path = os.path.join(ARCHIVE_DIR, f"day={day.isoformat()}", filename)
+    if not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail="Archive not found")
+    return FileResponse(
+        path,
+        media_type="application/vnd.apache.parquet",
+        filename=f"failed_logins-{day.isoformat()}-{filename}",
+    )
+
 @app.post("/logs/")
 def create_log(log: AttackLog):
     """Insert a new log into the database."""
@@ -265,68 +823,278 @@ def create_log(log: AttackLog):
     finally:
         db_pool.putconn(conn)
 
-@app.websocket("/ws/maplogs")
-async def websocket_endpoint(websocket: WebSocket):
+def warm_connections():
+    """Open POOL_MINCONN connections (each prepares its statements) and hand them back."""
+    conns = [db_pool.getconn() for _ in range(POOL_MINCONN)]
+    for conn in conns:
+        db_pool.putconn(conn)
+
+def warm_caches():
+    """Fill the recent events and the default heatmaps so first requests are served warm."""
+    load_recent_events()
+    for kind in HEATMAP_QUERIES:
+        attack_heatmap(kind, days=HEATMAP_DEFAULT_DAYS, limit=HEATMAP_DEFAULT_LIMIT)
+
+async def warm_up():
+    """Create the pool with retry, then pre-warm connections and caches."""
+    delay = 1
+    while True:
+        try:
+            await asyncio.to_thread(warm_connections)
+            startup_state["database"] = True
+            break
+        except Exception as e:
+            startup_state["error"] = str(e)
+            print(f"Database not ready, retrying in {delay}s: {e}")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, DB_CONNECT_RETRY_MAX_DELAY)
+
+    startup_state["error"] = None
+    if WARMUP_ON_STARTUP:
+        try:
+            await asyncio.to_thread(warm_caches)
+        except Exception as e:
+            # Caches fill lazily on first use; don't hold readiness hostage.
+            error = e.detail if isinstance(e, HTTPException) else e
+            startup_state["error"] = f"Warm-up failed: {error}"
+            print(f"Warm-up failed: {error}")
+    startup_state["warm"] = True
+
+async def relay_broadcasts():
+    """Forward every backplane message to the WebSocket clients of this worker."""
+    while True:
+        try:
+            async for message in backplane.subscribe(MAPLOGS_CHANNEL):
+                await manager.send_data(message)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Backplane subscription error: {e}")
+            await asyncio.sleep(1)
+
+async def apply_new_events():
     """
-    WebSocket endpoint to send real-time log data.
+    Apply rows published on the events channel to this worker's recent events
+    and wake its WebSocket clients.
+    """
+    while True:
+        try:
+            async for message in backplane.subscribe(EVENTS_CHANNEL):
+                if message.get("reload"):
+                    # The archiver deleted old rows the buffer may still hold.
+                    await asyncio.to_thread(load_recent_events)
+                elif message["after_id"] != recent_events.latest_id:
+                    # Missed a batch (or started mid-stream): reload instead of leaving a gap.
+                    await asyncio.to_thread(load_recent_events)
+                else:
+                    recent_events.extend(message["rows"])
+                manager.notify_new_events()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Backplane subscription error: {e}")
+            await asyncio.sleep(1)
+
+ALERT_COLUMNS = "id, window_start, dimension, key, count, baseline, created_at"
+
+def alert_to_dict(row) -> dict:
+    return {
+        "id": row[0],
+        "window_start": row[1].strftime("%Y-%m-%d %H:%M:%S"),
+        "dimension": row[2],
+        "key": row[3],
+        "count": row[4],
+        "baseline": row[5],
+        "created_at": row[6].strftime("%Y-%m-%d %H:%M:%S"),
+    }
+
+def fetch_alerts_since(after_id: Optional[int]):
+    """Fetch alerts newer than after_id, oldest first. None only returns the latest id."""
+    conn = db_pool.getconn()
+    try:
+        cursor = conn.cursor()
+        if after_id is None:
+            cursor.execute("SELECT COALESCE(MAX(id), 0) FROM alerts;")
+            latest = cursor.fetchone()[0]
+            cursor.close()
+            return latest, []
+        cursor.execute(f"SELECT {ALERT_COLUMNS} FROM alerts WHERE id > %s ORDER BY id;", (after_id,))
+        rows = cursor.fetchall()
+        cursor.close()
+        return (rows[-1][0] if rows else after_id), rows
+    finally:
+        db_pool.putconn(conn)
+
+@app.get("/alerts/")
+def read_alerts(limit: int = 50):
+    """Fetch the most recent burst alerts raised by the scraper."""
+    conn = db_pool.getconn()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT {ALERT_COLUMNS} FROM alerts ORDER BY id DESC LIMIT %s;", (limit,))
+        rows = cursor.fetchall()
+        cursor.close()
+        return [alert_to_dict(row) for row in rows]
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching alerts: {e}")
+    finally:
+        db_pool.putconn(conn)
+
+async def publish_new_events():
+    """
+    Poll for newly inserted rows and alerts and publish them once for all workers.
+
+    Only the worker holding the publisher lease polls the database, and the
+    polls are index range scans on id rather than the full map query. New
+    alerts go straight to WebSocket clients as {"type": "alert"} messages. The
+    alert cursor is kept in the backplane so a new leader resumes where the
+    previous one stopped instead of skipping alerts written in between.
     """
-    await manager.connect(websocket)
-    last_sent_timestamp = None  # Track the timestamp of the last sent log
+    last_alert_id = None  # None until this worker becomes leader
+    while True:
+        try:
+            if await backplane.acquire_leader("events-publisher", ttl=MAPLOGS_POLL_INTERVAL * 3):
+                if not recent_events.loaded:
+                    await asyncio.to_thread(load_recent_events)
+                after_id = recent_events.latest_id
+                rows = await asyncio.to_thread(fetch_events_since, after_id)
+                if rows:
+                    await backplane.publish(EVENTS_CHANNEL, {
+                        "after_id": after_id,
+                        "rows": [(row[0], int(row[1].timestamp()), *row[2:]) for row in rows],
+                    })
+
+                if last_alert_id is None:
+                    last_alert_id = await backplane.get_cursor("alerts")
+                last_alert_id, alerts = await asyncio.to_thread(fetch_alerts_since, last_alert_id)
+                for alert in alerts:
+                    await backplane.publish(MAPLOGS_CHANNEL, {"type": "alert", "data": alert_to_dict(alert)})
+                await backplane.set_cursor("alerts", last_alert_id)
+            else:
+                last_alert_id = None
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Database error: {e}")
+
+        await asyncio.sleep(MAPLOGS_POLL_INTERVAL)
+
+# Map snapshot shared by all legacy clients: (latest row id, rows)
+map_snapshot_cache = (None, None)
+
+async def shared_map_rows():
+    """Current map snapshot rows, computed once per new batch of rows."""
+    global map_snapshot_cache
+    latest_id = recent_events.latest_id
+    if map_snapshot_cache[0] != latest_id or not recent_events.loaded:
+        map_snapshot_cache = (latest_id, await asyncio.to_thread(current_map_rows))
+    return map_snapshot_cache[1]
+
+async def next_update(subscriber: Subscriber) -> Optional[dict]:
+    """The update a client is missing, or None if it is up to date."""
+    if not subscriber.subscribed:
+        rows = await shared_map_rows()
+        if subscriber.subscribed:
+            # Subscribed while the snapshot was being built: it's no longer wanted.
+            return None
+        key = rows[0][1] if rows else None
+        if key is None or key == subscriber.last_snapshot_key:
+            return None
+        subscriber.last_snapshot_key = key
+        return {"type": "logs", "data": [row_to_log(row) for row in rows]}
+
+    latest_id, rows, evicted = recent_events.rows_since(
+        subscriber.cursor, subscriber.matches, WS_MAX_DELTA_ROWS
+    )
+    if evicted:
+        # The client is further behind than the buffer reaches: resync it.
+        subscriber.cursor = latest_id
+        return {
+            "type": "snapshot",
+            "cursor": latest_id,
+            "data": [row_to_log(row) for row in rows],
+        }
+    if latest_id <= subscriber.cursor:
+        return None
+    subscriber.cursor = latest_id
+    if not rows:
+        return None
+    return {
+        "type": "delta",
+        "cursor": latest_id,
+        "truncated": len(rows) > WS_MAX_DELTA_ROWS,
+        "data": [row_to_log(row) for row in rows[:WS_MAX_DELTA_ROWS]],
+    }
 
+async def run_sender(subscriber: Subscriber):
+    """
+    Deliver updates to one client.
+
+    Wakeups that arrive while a send is in progress or during the minimum
+    send interval are coalesced into one update, so a slow client gets
+    fewer, larger messages instead of an unbounded queue.
+    """
+    websocket = subscriber.websocket
     try:
         while True:
             try:
-                conn = db_pool.getconn()
-                try:
-                    cursor = conn.cursor()
-                    cursor.execute("""
-                        WITH ranked_entries AS (
-                            SELECT 
-                                ip_address, 
-                                timestamp, 
-                                port, 
-                                city, 
-                                region, 
-                                country, 
-                                latitude, 
-                                longitude,
-                                ROW_NUMBER() OVER (PARTITION BY city ORDER BY timestamp DESC) AS rank
-                            FROM failed_logins
-                            WHERE city IS NOT NULL
-                        )
-                        SELECT ip_address, timestamp, port, city, region, country, latitude, longitude
-                        FROM ranked_entries
-                        WHERE rank <= 2
-                        ORDER BY timestamp DESC
-                        LIMIT 100;
-                    """)
-                    rows = cursor.fetchall()
-                    logs = [
-                        {
-                            "ip_address": row[0],
-                            "timestamp": row[1].strftime("%Y-%m-%d %H:%M:%S"),
-                            "port": row[2],
-                            "city": row[3],
-                            "region": row[4],
-                            "country": row[5],
-                            "latitude": row[6],
-                            "longitude": row[7],
-                        }
-                        for row in rows
-                    ]
-                    cursor.close()
-                finally:
-                    db_pool.putconn(conn)
-
-                # Send only new logs based on timestamp
-                if logs and (last_sent_timestamp is None or logs[0]["timestamp"] > last_sent_timestamp):
-                    await manager.send_data({"type": "logs", "data": logs})
-                    last_sent_timestamp = logs[0]["timestamp"]
+                await asyncio.wait_for(subscriber.wakeup.wait(), timeout=WS_HEARTBEAT_INTERVAL)
+            except asyncio.TimeoutError:
+                await websocket.send_json({"type": "ping"})
+                continue
+            subscriber.wakeup.clear()
 
+            while subscriber.pending:
+                await websocket.send_json(subscriber.pending.popleft())
+            try:
+                update = await next_update(subscriber)
             except Exception as db_error:
                 print(f"Database error: {db_error}")
+                update = None
+            if update is not None:
+                await websocket.send_json(update)
+
+            await asyncio.sleep(WS_MIN_SEND_INTERVAL)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        # The receive loop notices the disconnect and cleans up.
+        print(f"Error sending data to client: {e}")
 
-            await asyncio.sleep(5)  # Update every 5 seconds
+@app.websocket("/ws/maplogs")
+async def websocket_endpoint(websocket: WebSocket):
+    """
+    WebSocket endpoint to send real-time log data.
+
+    New clients get the current map snapshot and a new snapshot whenever
+    it changes. Clients can instead send
+    {"type": "subscribe", "filters": {"country": [...], "port": [...], "bbox": [s, w, n, e]}, "cursor": id}
+    to receive only matching rows newer than the cursor as {"type": "delta"} messages.
+    Alerts and {"type": "ping"} heartbeats go to every client.
+    """
+    subscriber = await manager.connect(websocket)
+    sender = asyncio.create_task(run_sender(subscriber))
+
+    try:
+        while True:
+            try:
+                message = json.loads(await websocket.receive_text())
+            except ValueError:
+                await websocket.send_json({"type": "error", "detail": "Messages must be JSON"})
+                continue
+            if not isinstance(message, dict) or message.get("type") != "subscribe":
+                await websocket.send_json({"type": "error", "detail": "Expected a subscribe message"})
+                continue
+            try:
+                subscriber.subscribe(message)
+            except (AttributeError, TypeError, ValueError) as e:
+                await websocket.send_json({"type": "error", "detail": str(e)})
+                continue
+            await websocket.send_json({"type": "subscribed", "cursor": subscriber.cursor})
     except WebSocketDisconnect:
         print(f"WebSocket disconnected: {websocket.client}")
-        manager.disconnect(websocket)
+    except Exception as e:
+        print(f"WebSocket error: {e}")
+    finally:
+        sender.cancel()
+        manager.disconnect(subscriber)
@@ -0,0 +1,123 @@
+"""Pub/sub backplane used to fan WebSocket messages out across API workers.
+
+Each uvicorn worker keeps its own list of WebSocket clients. Messages are
+published once to the backplane and every worker relays them to its local
+clients. ``redis://`` URLs use Redis pub/sub; ``memory://`` is an in-process
+stand-in for single-worker runs and tests.
+"""
+import asyncio
+import json
+import os
+import uuid
+from urllib.parse import urlparse
+
+
+RENEW_LEASE_SCRIPT = """
+if redis.call("GET", KEYS[1]) == ARGV[1] then
+    return redis.call("PEXPIRE", KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+
+class MemoryBackplane:
+    """In-process backplane. Only reaches subscribers in the same process."""
+
+    def __init__(self):
+        self.subscribers = {}
+        self.leases = {}
+        self.cursors = {}
+
+    async def connect(self):
+        pass
+
+    async def disconnect(self):
+        self.subscribers.clear()
+
+    async def publish(self, channel: str, message: dict):
+        for queue in list(self.subscribers.get(channel, ())):
+            queue.put_nowait(message)
+
+    async def subscribe(self, channel: str):
+        """Async generator yielding every message published on channel."""
+        queue = asyncio.Queue()
+        self.subscribers.setdefault(channel, set()).add(queue)
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            self.subscribers[channel].discard(queue)
+
+    async def acquire_leader(self, name: str, ttl: float) -> bool:
+        # A single process is always the leader.
+        return True
+
+    async def get_cursor(self, name: str):
+        return self.cursors.get(name)
+
+    async def set_cursor(self, name: str, value: int):
+        self.cursors[name] = value
+
+
+class RedisBackplane:
+    """Redis pub/sub backplane shared by all workers (and hosts)."""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.worker_id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.redis = None
+
+    async def connect(self):
+        import redis.asyncio as redis
+
+        self.redis = redis.from_url(self.url, decode_responses=True)
+        await self.redis.ping()
+
+    async def disconnect(self):
+        if self.redis is not None:
+            await self.redis.close()
+            self.redis = None
+
+    async def publish(self, channel: str, message: dict):
+        await self.redis.publish(channel, json.dumps(message, default=str))
+
+    async def subscribe(self, channel: str):
+        """Async generator yielding every message published on channel."""
+        pubsub = self.redis.pubsub()
+        await pubsub.subscribe(channel)
+        try:
+            async for raw in pubsub.listen():
+                if raw["type"] == "message":
+                    yield json.loads(raw["data"])
+        finally:
+            await pubsub.unsubscribe(channel)
+            await pubsub.close()
+
+    async def acquire_leader(self, name: str, ttl: float) -> bool:
+        """Take or renew a lease so only one worker runs a periodic job."""
+        key = f"leader:{name}"
+        ttl_ms = int(ttl * 1000)
+        if await self.redis.set(key, self.worker_id, nx=True, px=ttl_ms):
+            return True
+        # Compare-and-renew in one step so an expired lease taken over by
+        # another worker isn't extended on its behalf.
+        return bool(await self.redis.eval(RENEW_LEASE_SCRIPT, 1, key, self.worker_id, ttl_ms))
+
+    async def get_cursor(self, name: str):
+        """Last position stored by whichever worker led a job, or None."""
+        value = await self.redis.get(f"cursor:{name}")
+        return int(value) if value is not None else None
+
+    async def set_cursor(self, name: str, value: int):
+        """Store a job's position so the next leader resumes from it."""
+        await self.redis.set(f"cursor:{name}", value)
+
+
+def get_backplane(url: str):
+    """Build a backplane from a URL such as ``memory://`` or ``redis://redis:6379/0``."""
+    scheme = urlparse(url).scheme
+    if scheme == "memory":
+        return MemoryBackplane()
+    if scheme in ("redis", "rediss"):
+        return RedisBackplane(url)
+    raise ValueError(f"Unsupported BROADCAST_URL scheme: {scheme!r}")
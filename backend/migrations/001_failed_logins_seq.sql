@@ -0,0 +1,7 @@
+-- Allow several distinct failed logins from the same ip/port in the same second.
+-- The scraper numbers them with seq (0, 1, 2, ...) in log order.
+ALTER TABLE failed_logins ADD COLUMN IF NOT EXISTS seq SMALLINT NOT NULL DEFAULT 0;
+
+ALTER TABLE failed_logins DROP CONSTRAINT IF EXISTS unique_failed_login;
+ALTER TABLE failed_logins
+    ADD CONSTRAINT unique_failed_login UNIQUE (timestamp, ip_address, port, seq);
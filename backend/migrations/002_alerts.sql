@@ -0,0 +1,11 @@
+-- Bursts flagged by the scraper's streaming detector
+CREATE TABLE IF NOT EXISTS alerts (
+    id SERIAL PRIMARY KEY,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    window_start TIMESTAMPTZ NOT NULL,
+    dimension VARCHAR(16) NOT NULL,  -- country, subnet or port
+    key VARCHAR(255) NOT NULL,
+    count INTEGER NOT NULL,
+    baseline FLOAT NOT NULL,
+    CONSTRAINT unique_alert UNIQUE (dimension, key, window_start)
+);
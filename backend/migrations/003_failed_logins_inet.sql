@@ -0,0 +1,6 @@
+-- Store addresses as inet (IPv4 and IPv6) and index them for subnet containment queries.
+ALTER TABLE failed_logins
+    ALTER COLUMN ip_address TYPE INET USING ip_address::inet;
+
+DROP INDEX IF EXISTS idx_ip_address;
+CREATE INDEX IF NOT EXISTS idx_ip_address ON failed_logins USING gist (ip_address inet_ops);
@@ -0,0 +1,18 @@
+-- Hourly attempt counts for rows moved out of failed_logins by the archiver.
+-- country is '' when unknown so it can be part of the primary key.
+CREATE TABLE IF NOT EXISTS failed_logins_rollup (
+    bucket TIMESTAMPTZ NOT NULL,
+    country VARCHAR(255) NOT NULL,
+    port INTEGER NOT NULL,
+    attempts BIGINT NOT NULL,
+    PRIMARY KEY (bucket, country, port)
+);
+
+-- Hourly counts over hot and archived rows; charts read this so archiving keeps totals intact.
+CREATE OR REPLACE VIEW attack_counts AS
+    SELECT date_trunc('hour', timestamp) AS bucket, country, port, COUNT(*) AS attempts
+    FROM failed_logins
+    GROUP BY 1, 2, 3
+    UNION ALL
+    SELECT bucket, NULLIF(country, ''), port, attempts
+    FROM failed_logins_rollup;
@@ -0,0 +1,8 @@
+-- Count hot rows by attempts like the rollup does, so archiving a row doesn't change the totals.
+CREATE OR REPLACE VIEW attack_counts AS
+    SELECT date_trunc('hour', timestamp) AS bucket, country, port, SUM(COALESCE(attempts, 1)) AS attempts
+    FROM failed_logins
+    GROUP BY 1, 2, 3
+    UNION ALL
+    SELECT bucket, NULLIF(country, ''), port, attempts
+    FROM failed_logins_rollup;
@@ -0,0 +1,216 @@
+"""Fixed-capacity in-memory buffer of the most recent failed logins.
+
+Rows are stored column-wise in preallocated ``array`` columns (row id, epoch
+seconds, packed IPv4, port, geo index) so memory use is fixed by the
+capacity and no per-row objects are kept. City/region/country/lat/lon
+tuples are interned once, referenced by index and freed when the last row
+using them is evicted. Addresses that don't fit the packed IPv4 column are
+kept in a small side table keyed by slot.
+
+The buffer is written from the event loop and worker threads and read from
+the threadpool, so every public method holds ``lock``.
+"""
+import ipaddress
+import threading
+from itertools import islice
+from array import array
+from datetime import datetime, timezone
+
+NO_GEO = -1
+
+
+class RecentEvents:
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.ids = array("q", [0]) * capacity
+        self.timestamps = array("q", [0]) * capacity
+        self.ips = array("I", [0]) * capacity
+        self.ports = array("H", [0]) * capacity
+        self.geo_refs = array("i", [NO_GEO]) * capacity
+        self.other_ips = {}  # slot -> address that isn't IPv4
+        self.geo_table = []  # (city, region, country, latitude, longitude)
+        self.geo_index = {}
+        self.geo_counts = []  # rows referencing each geo_table entry
+        self.free_geo_refs = []
+        self.lock = threading.Lock()
+        self.next_slot = 0
+        self.size = 0
+        # True while the buffer holds every row in the table, i.e. it was
+        # loaded from a table smaller than capacity and has not wrapped since.
+        self.complete = False
+        self.loaded = False
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def latest_id(self) -> int:
+        with self.lock:
+            if not self.size:
+                return 0
+            return self.ids[(self.next_slot - 1) % self.capacity]
+
+    def _intern_geo(self, geo) -> int:
+        if all(value is None for value in geo):
+            return NO_GEO
+        ref = self.geo_index.get(geo)
+        if ref is None:
+            if self.free_geo_refs:
+                ref = self.free_geo_refs.pop()
+                self.geo_table[ref] = geo
+                self.geo_counts[ref] = 0
+            else:
+                ref = len(self.geo_table)
+                self.geo_table.append(geo)
+                self.geo_counts.append(0)
+            self.geo_index[geo] = ref
+        self.geo_counts[ref] += 1
+        return ref
+
+    def _release_geo(self, ref):
+        if ref == NO_GEO:
+            return
+        self.geo_counts[ref] -= 1
+        if not self.geo_counts[ref]:
+            del self.geo_index[self.geo_table[ref]]
+            self.geo_table[ref] = None
+            self.free_geo_refs.append(ref)
+
+    def append(self, row_id, timestamp, ip_address, port, city, region, country, latitude, longitude):
+        """Store one row, overwriting the oldest once the buffer is full.
+
+        timestamp may be a datetime or epoch seconds.
+        """
+        with self.lock:
+            self._append(row_id, timestamp, ip_address, port, city, region, country, latitude, longitude)
+
+    def _append(self, row_id, timestamp, ip_address, port, city, region, country, latitude, longitude):
+        slot = self.next_slot
+        if self.size == self.capacity:
+            self._release_geo(self.geo_refs[slot])
+        self.other_ips.pop(slot, None)
+        self.ids[slot] = row_id
+        if isinstance(timestamp, datetime):
+            timestamp = int(timestamp.timestamp())
+        self.timestamps[slot] = timestamp
+        try:
+            self.ips[slot] = int(ipaddress.IPv4Address(ip_address))
+        except ValueError:
+            self.ips[slot] = 0
+            self.other_ips[slot] = str(ip_address)
+        self.ports[slot] = port
+        self.geo_refs[slot] = self._intern_geo((city, region, country, latitude, longitude))
+
+        self.next_slot = (slot + 1) % self.capacity
+        if self.size < self.capacity:
+            self.size += 1
+        else:
+            self.complete = False
+
+    def extend(self, rows):
+        """Append (id, timestamp, ip, port, city, region, country, lat, lon) rows in id order."""
+        with self.lock:
+            for row in rows:
+                self._append(*row)
+
+    def load(self, rows, complete: bool):
+        """Replace the contents with rows (oldest first)."""
+        with self.lock:
+            self.next_slot = 0
+            self.size = 0
+            self.other_ips.clear()
+            self.geo_table.clear()
+            self.geo_index.clear()
+            self.geo_counts.clear()
+            self.free_geo_refs.clear()
+            for row in rows:
+                self._append(*row)
+            self.complete = complete
+            self.loaded = True
+
+    def _slots_newest_first(self):
+        # Callers hold the lock; next_slot and size are read once regardless.
+        next_slot, size = self.next_slot, self.size
+        for i in range(1, size + 1):
+            yield (next_slot - i) % self.capacity
+
+    def _filter_row(self, slot):
+        ref = self.geo_refs[slot]
+        geo = self.geo_table[ref] if ref != NO_GEO else (None,) * 5
+        return (None, None, self.ports[slot], *geo)
+
+    def row(self, slot):
+        """Return the slot as an (ip, timestamp, port, city, region, country, lat, lon) row."""
+        ip = self.other_ips.get(slot) or str(ipaddress.IPv4Address(self.ips[slot]))
+        ref = self.geo_refs[slot]
+        city, region, country, latitude, longitude = (
+            self.geo_table[ref] if ref != NO_GEO else (None,) * 5
+        )
+        timestamp = datetime.fromtimestamp(self.timestamps[slot], timezone.utc)
+        return (ip, timestamp, self.ports[slot], city, region, country, latitude, longitude)
+
+    def latest_rows(self, limit: int, offset: int = 0):
+        """Newest rows first, or None if the buffer can't answer the whole page."""
+        with self.lock:
+            if offset + limit > self.size and not self.complete:
+                return None
+            slots = islice(self._slots_newest_first(), offset, offset + limit)
+            return [self.row(slot) for slot in slots]
+
+    def map_rows(self, limit: int = 100, per_city: int = 2):
+        """
+        Newest rows with a known city, at most per_city rows per city.
+
+        Mirrors the /maplogs/ query. Returns None when the buffer runs out
+        before the answer is known to be complete.
+        """
+        with self.lock:
+            city_counts = {}
+            slots = []
+            for slot in self._slots_newest_first():
+                ref = self.geo_refs[slot]
+                if ref == NO_GEO:
+                    continue
+                city = self.geo_table[ref][0]
+                if city is None or city_counts.get(city, 0) >= per_city:
+                    continue
+                city_counts[city] = city_counts.get(city, 0) + 1
+                slots.append(slot)
+                if len(slots) == limit:
+                    break
+            else:
+                if not self.complete:
+                    return None
+            slots.sort(key=lambda slot: self.timestamps[slot], reverse=True)
+            return [self.row(slot) for slot in slots]
+
+    def rows_since(self, after_id: int, matches=None, limit=None):
+        """
+        (latest_id, rows, evicted) for rows inserted after after_id, newest first.
+
+        Only rows accepted by matches are returned, and the scan stops once
+        limit + 1 have matched, so callers can tell the answer was cut short.
+        matches gets the row with ip and timestamp left as None, so filtering
+        on port and geo doesn't pay for decoding every row.
+        evicted is True when rows after after_id may already have been
+        overwritten; rows then holds the matches among the newest limit rows.
+        """
+        with self.lock:
+            next_slot, size = self.next_slot, self.size
+            if not size:
+                return 0, [], False
+            latest_id = self.ids[(next_slot - 1) % self.capacity]
+            oldest_id = self.ids[(next_slot - size) % self.capacity]
+            evicted = after_id < oldest_id and not self.complete
+            slots = self._slots_newest_first()
+            if evicted and limit is not None:
+                slots = islice(slots, limit)
+            rows = []
+            for slot in slots:
+                if not evicted and self.ids[slot] <= after_id:
+                    break
+                if matches is None or matches(self._filter_row(slot)):
+                    rows.append(self.row(slot))
+                    if limit is not None and not evicted and len(rows) > limit:
+                        break
+            return latest_id, rows, evicted
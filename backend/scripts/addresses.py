@@ -0,0 +1,17 @@
+import ipaddress
+
+
+def normalize_ip(address):
+    """
+    Validate an address taken from auth.log and return its canonical form, or None.
+
+    The log regex also matches hex-looking hostnames, which would only fail
+    at the inet insert after a geolocation lookup. sshd on a dual-stack
+    socket logs IPv4 clients as ::ffff:a.b.c.d; those are stored as plain
+    IPv4 so every scraper writes the same value.
+    """
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return None
+    return str(getattr(ip, "ipv4_mapped", None) or ip)
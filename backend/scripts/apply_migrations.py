@@ -0,0 +1,104 @@
+import os
+import sys
+import time
+import logging
+import psycopg2
+from dotenv import load_dotenv
+
+# Load environment variables from .env
+load_dotenv()
+
+# Database connection parameters
+DB_CONFIG = {
+    "dbname": os.getenv("POSTGRES_DB"),
+    "user": os.getenv("POSTGRES_USER"),
+    "password": os.getenv("POSTGRES_PASSWORD"),
+    "host": "timescaledb",
+    "port": 5432,
+}
+
+MIGRATIONS_DIR = os.getenv(
+    "MIGRATIONS_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "migrations")
+)
+CONNECT_ATTEMPTS = 10
+MIGRATION_LOCK_ID = 7201  # pg_advisory_lock key, keeps concurrent runners from interleaving
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+def pending_migrations(applied):
+    """Migration file names not yet recorded in schema_migrations, in order."""
+    names = sorted(name for name in os.listdir(MIGRATIONS_DIR) if name.endswith(".sql"))
+    return [name for name in names if name not in applied]
+
+
+def connect():
+    """Connect to the database, retrying while it starts up."""
+    for attempt in range(1, CONNECT_ATTEMPTS + 1):
+        try:
+            return psycopg2.connect(**DB_CONFIG)
+        except psycopg2.OperationalError as e:
+            if attempt == CONNECT_ATTEMPTS:
+                raise
+            logging.warning(f"Database not reachable ({e}), retrying...")
+            time.sleep(min(2 ** attempt, 30))
+
+
+def apply_migrations():
+    """
+    Apply every migration in MIGRATIONS_DIR that hasn't been applied yet.
+
+    Each file runs in its own transaction together with its schema_migrations
+    row, so a failed migration leaves no trace and is retried on the next run.
+    The migrations are idempotent, so databases created from init.sql (which
+    already has the latest schema) just get them recorded.
+    """
+    conn = connect()
+    applied_now = []
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT pg_advisory_lock(%s);", (MIGRATION_LOCK_ID,))
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                name VARCHAR(255) PRIMARY KEY,
+                applied_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+            );
+            """
+        )
+        conn.commit()
+
+        cursor.execute("SELECT name FROM schema_migrations;")
+        applied = {row[0] for row in cursor.fetchall()}
+        for name in pending_migrations(applied):
+            with open(os.path.join(MIGRATIONS_DIR, name)) as f:
+                sql = f.read()
+            try:
+                cursor.execute(sql)
+                cursor.execute("INSERT INTO schema_migrations (name) VALUES (%s);", (name,))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                logging.error(f"Migration {name} failed.")
+                raise
+            logging.info(f"Applied migration {name}.")
+            applied_now.append(name)
+
+        cursor.execute("SELECT pg_advisory_unlock(%s);", (MIGRATION_LOCK_ID,))
+        conn.commit()
+        cursor.close()
+    finally:
+        conn.close()
+
+    logging.info(f"{len(applied_now)} migration(s) applied.")
+    return applied_now
+
+
+if __name__ == "__main__":
+    print("Applying database migrations...")
+    try:
+        apply_migrations()
+    except Exception as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    print("Migrations completed.")
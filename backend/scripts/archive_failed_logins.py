@@ -0,0 +1,226 @@
+import os
+import sys
+import json
+import time
+import logging
+import psycopg2
+from psycopg2.extras import execute_values
+from dotenv import load_dotenv
+from datetime import datetime, timedelta, timezone
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Load environment variables from .env
+load_dotenv()
+
+# Database connection parameters
+DB_CONFIG = {
+    "dbname": os.getenv("POSTGRES_DB"),
+    "user": os.getenv("POSTGRES_USER"),
+    "password": os.getenv("POSTGRES_PASSWORD"),
+    "host": "timescaledb",
+    "port": 5432,
+}
+
+# Archive settings
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "/archive")
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "90"))  # rows older than this leave the hot table
+BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "10000"))  # rows per Parquet file / DELETE
+RUN_INTERVAL = 24 * 60 * 60  # seconds between runs with --loop
+
+# API workers keep the newest rows in memory; they reload when told rows were archived
+BROADCAST_URL = os.getenv("BROADCAST_URL")
+EVENTS_CHANNEL = "events"  # same channel as api.py
+
+SCHEMA = pa.schema([
+    ("id", pa.int64()),
+    ("timestamp", pa.timestamp("us", tz="UTC")),
+    ("ip_address", pa.string()),
+    ("port", pa.int32()),
+    ("seq", pa.int16()),
+    ("city", pa.string()),
+    ("region", pa.string()),
+    ("country", pa.string()),
+    ("latitude", pa.float64()),
+    ("longitude", pa.float64()),
+    ("attempts", pa.int32()),
+])
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+def write_partitions(rows):
+    """
+    Write one batch as compressed Parquet, one file per day=YYYY-MM-DD partition.
+
+    Files are written under dot-prefixed temp names, which dataset scans
+    skip, and returned as (tmp_path, path) pairs to publish once the batch
+    is deleted from the table. See recover_partitions() for crashes in between.
+    """
+    written = []
+    by_day = {}
+    for row in rows:
+        by_day.setdefault(row[1].date(), []).append(row)
+
+    for day, day_rows in by_day.items():
+        partition = os.path.join(ARCHIVE_DIR, f"day={day.isoformat()}")
+        os.makedirs(partition, exist_ok=True)
+        path = os.path.join(partition, f"part-{day_rows[0][0]}-{day_rows[-1][0]}.parquet")
+        columns = list(zip(*day_rows))
+        table = pa.Table.from_arrays(
+            [pa.array(column, type=field.type) for column, field in zip(columns, SCHEMA)],
+            schema=SCHEMA,
+        )
+        tmp_path = os.path.join(partition, f".{os.path.basename(path)}.tmp")
+        pq.write_table(table, tmp_path, compression="zstd")
+        written.append((tmp_path, path))
+    return written
+
+
+def publish_partitions(written):
+    for tmp_path, path in written:
+        os.replace(tmp_path, path)
+
+
+def recover_partitions(conn):
+    """
+    Settle temp files left by a run that crashed between writing and publishing a batch.
+
+    The DELETE is one transaction, so either none of a file's rows are still
+    in failed_logins (the batch committed: publish the file) or they all are
+    (it didn't: drop the file, the rows get archived again). Unreadable files
+    were still being written, so their batch never committed either.
+    """
+    if not os.path.isdir(ARCHIVE_DIR):
+        return
+    cursor = conn.cursor()
+    for entry in sorted(os.listdir(ARCHIVE_DIR)):
+        partition = os.path.join(ARCHIVE_DIR, entry)
+        if not entry.startswith("day=") or not os.path.isdir(partition):
+            continue
+        for name in os.listdir(partition):
+            if not (name.startswith(".part-") and name.endswith(".parquet.tmp")):
+                continue
+            tmp_path = os.path.join(partition, name)
+            try:
+                ids = pq.read_table(tmp_path, columns=["id"]).column("id").to_pylist()
+            except Exception:
+                ids = None
+            if ids:
+                cursor.execute("SELECT EXISTS(SELECT 1 FROM failed_logins WHERE id = ANY(%s));", (ids,))
+                committed = not cursor.fetchone()[0]
+            else:
+                committed = False
+            if committed:
+                os.replace(tmp_path, os.path.join(partition, name[1:-len(".tmp")]))
+                logging.info(f"Published {name[1:-len('.tmp')]} left over from an interrupted run.")
+            else:
+                os.remove(tmp_path)
+                logging.info(f"Removed {name} left over from an interrupted run.")
+    conn.commit()
+    cursor.close()
+
+
+def notify_api():
+    """Tell API workers to reload their in-memory rows, which may include archived ones."""
+    if not BROADCAST_URL:
+        return
+    import redis
+
+    client = redis.Redis.from_url(BROADCAST_URL)
+    try:
+        client.publish(EVENTS_CHANNEL, json.dumps({"reload": True}))
+    except redis.RedisError as e:
+        logging.error(f"Could not notify the API of archived rows: {e}")
+    finally:
+        client.close()
+
+
+def rollup_counts(rows):
+    """Hourly (bucket, country, port) attempt counts for the batch."""
+    counts = {}
+    for row in rows:
+        key = (row[1].replace(minute=0, second=0, microsecond=0), row[7] or "", row[3])
+        counts[key] = counts.get(key, 0) + (row[10] or 1)
+    return [(*key, count) for key, count in counts.items()]
+
+
+def archive_batch(conn, rows):
+    """Add the batch to the rollups and delete it from the hot table in one transaction."""
+    cursor = conn.cursor()
+    try:
+        execute_values(
+            cursor,
+            """
+            INSERT INTO failed_logins_rollup (bucket, country, port, attempts)
+            VALUES %s
+            ON CONFLICT (bucket, country, port)
+            DO UPDATE SET attempts = failed_logins_rollup.attempts + EXCLUDED.attempts;
+            """,
+            rollup_counts(rows),
+        )
+        cursor.execute("DELETE FROM failed_logins WHERE id = ANY(%s);", ([row[0] for row in rows],))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def archive_old_logins(max_age_days=ARCHIVE_AFTER_DAYS):
+    """Move rows older than max_age_days from failed_logins to Parquet files."""
+    cutoff = datetime.now(timezone.utc) - timedelta(days=max_age_days)
+    read_conn = psycopg2.connect(**DB_CONFIG)
+    write_conn = psycopg2.connect(**DB_CONFIG)
+    archived = 0
+
+    try:
+        recover_partitions(write_conn)
+        # Server-side cursor: rows are streamed in BATCH_SIZE chunks, never loaded all at once.
+        cursor = read_conn.cursor(name="archive_failed_logins")
+        cursor.itersize = BATCH_SIZE
+        cursor.execute(
+            """
+            SELECT id, timestamp, host(ip_address), port, seq, city, region, country,
+                   latitude, longitude, attempts
+            FROM failed_logins
+            WHERE timestamp < %s
+            ORDER BY id;
+            """,
+            (cutoff,),
+        )
+        while True:
+            rows = cursor.fetchmany(BATCH_SIZE)
+            if not rows:
+                break
+            written = write_partitions(rows)
+            archive_batch(write_conn, rows)
+            publish_partitions(written)
+            archived += len(rows)
+            logging.info(f"Archived {archived} rows so far...")
+        cursor.close()
+    finally:
+        read_conn.close()
+        write_conn.close()
+
+    logging.info(f"Archived {archived} rows older than {cutoff:%Y-%m-%d %H:%M:%S} to {ARCHIVE_DIR}.")
+    if archived:
+        notify_api()
+    return archived
+
+
+if __name__ == "__main__":
+    print("Starting failed_logins archiver...")
+
+    while True:
+        try:
+            archive_old_logins()
+        except Exception as e:
+            print(f"Error: {e}")
+
+        if "--loop" not in sys.argv:
+            break
+        time.sleep(RUN_INTERVAL)
+
+    print("Archiver completed.")
@@ -0,0 +1,117 @@
+import ipaddress
+import logging
+import os
+from datetime import datetime, timezone
+
+# Burst detection settings
+WINDOW_SECONDS = int(os.getenv("BURST_WINDOW_SECONDS", "60"))  # length of one counting window
+MIN_COUNT = int(os.getenv("BURST_MIN_COUNT", "20"))  # ignore keys with fewer attempts per window
+FACTOR = float(os.getenv("BURST_FACTOR", "5"))  # alert when a window exceeds FACTOR x the baseline
+ALPHA = float(os.getenv("BURST_ALPHA", "0.1"))  # EWMA weight of the newest window
+WARMUP_WINDOWS = int(os.getenv("BURST_WARMUP_WINDOWS", "5"))  # windows to observe before alerting
+SKETCH_WIDTH = 2048
+SKETCH_DEPTH = 4
+
+
+class CountMinSketch:
+    """Fixed-size approximate counter; estimates never undercount."""
+
+    def __init__(self, width=SKETCH_WIDTH, depth=SKETCH_DEPTH):
+        self.width = width
+        self.depth = depth
+        self.rows = [[0.0] * width for _ in range(depth)]
+
+    def _cells(self, key):
+        return [hash((row, key)) % self.width for row in range(self.depth)]
+
+    def add(self, key, count=1):
+        """Increment key and return its new estimate."""
+        estimate = None
+        for row, cell in zip(self.rows, self._cells(key)):
+            row[cell] += count
+            estimate = row[cell] if estimate is None else min(estimate, row[cell])
+        return estimate
+
+    def estimate(self, key):
+        return min(row[cell] for row, cell in zip(self.rows, self._cells(key)))
+
+    def clear(self):
+        for row in self.rows:
+            row[:] = [0.0] * self.width
+
+
+class BurstDetector:
+    """
+    Flag bursts per country, source subnet (/24 or /48) and port as entries arrive.
+
+    Attempts are counted per fixed window of log time in one count-min
+    sketch. When a window closes it is folded into a second sketch holding
+    the exponentially weighted moving average of past windows. A key bursts
+    when its count in the current window reaches MIN_COUNT and FACTOR times
+    its baseline. Memory is constant no matter how many keys are seen.
+    """
+
+    def __init__(self):
+        self.current = CountMinSketch()
+        self.baseline = CountMinSketch()
+        self.window_start = None
+        self.windows_seen = 0
+        self.alerted = set()  # keys already flagged in the current window
+
+    def _roll(self, window_start):
+        """Close the current window(s) and fold them into the baseline."""
+        if self.window_start is not None:
+            elapsed = int((window_start - self.window_start).total_seconds()) // WINDOW_SECONDS
+            # The closed window, then decay once per empty window in between.
+            for base_row, current_row in zip(self.baseline.rows, self.current.rows):
+                for i, count in enumerate(current_row):
+                    base_row[i] = ALPHA * count + (1 - ALPHA) * base_row[i]
+            decay = (1 - ALPHA) ** min(elapsed - 1, 100)
+            if decay != 1:
+                for base_row in self.baseline.rows:
+                    base_row[:] = [value * decay for value in base_row]
+            self.windows_seen += elapsed
+            self.current.clear()
+        self.window_start = window_start
+        self.alerted.clear()
+
+    @staticmethod
+    def keys_for(entry, geo_data):
+        ip = ipaddress.ip_address(entry["ip_address"])
+        prefix = 24 if ip.version == 4 else 48
+        keys = [
+            ("subnet", str(ipaddress.ip_network(f"{ip}/{prefix}", strict=False))),
+            ("port", str(entry["port"])),
+        ]
+        if geo_data.get("country"):
+            keys.append(("country", geo_data["country"]))
+        return keys
+
+    def observe(self, entry, geo_data):
+        """Count one stored attempt and return a list of alert dicts (usually empty)."""
+        epoch = int(entry["timestamp"].timestamp())
+        window_start = datetime.fromtimestamp(epoch - epoch % WINDOW_SECONDS, timezone.utc)
+        if self.window_start is None or window_start > self.window_start:
+            self._roll(window_start)
+        elif window_start < self.window_start:
+            # Late entry from an already closed window: too late to judge.
+            return []
+
+        alerts = []
+        for key in self.keys_for(entry, geo_data):
+            count = self.current.add(key)
+            if self.windows_seen < WARMUP_WINDOWS or key in self.alerted:
+                continue
+            baseline = self.baseline.estimate(key)
+            if count >= MIN_COUNT and count >= FACTOR * max(baseline, 1.0):
+                self.alerted.add(key)
+                alert = {
+                    "window_start": self.window_start,
+                    "dimension": key[0],
+                    "key": key[1],
+                    "count": int(count),
+                    "baseline": round(baseline, 2),
+                }
+                logging.warning(f"Burst detected: {alert}")
+                alerts.append(alert)
+        return alerts
@@ -7,6 +7,8 @@ from dotenv import load_dotenv
 from datetime import datetime, timezone
 import logging
 
+from addresses import normalize_ip
+
 # Load environment variables from .env
 load_dotenv()
 
@@ -25,7 +27,7 @@ LOG_PATTERN = (
     r".*?"                                       # skip everything until ...
     r"(?:Invalid user|Failed password for(?: invalid user)?) "
     r"(\S+) "                                    # group(2) -> username
-    r"from ([\d.]+) "                            # group(3) -> IP
+    r"from ([0-9A-Fa-f:.]+) "                    # group(3) -> IPv4 or IPv6
     r"port (\d+)"                                # group(4) -> port
 )
 # Geolocation API
@@ -41,6 +43,7 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 def parse_new_logs(last_timestamp):
     parsed_data = []
     line_number = 0
+    sequences = {}  # (timestamp, ip, port) -> next seq for same-second events
 
     try:
         with open(LOG_FILE, "r") as file:
@@ -50,8 +53,11 @@ def parse_new_logs(last_timestamp):
                 if match:
                     timestamp_str = match.group(1)
                     user = match.group(2)
-                    ip_address = match.group(3)
+                    ip_address = normalize_ip(match.group(3))
                     port = match.group(4)
+                    if ip_address is None:
+                        logging.debug(f"Invalid IP address: {line.strip()}")
+                        continue
 
                     # Mark if the line has "invalid user" in it
                     if "invalid user" in line:
@@ -65,11 +71,17 @@ def parse_new_logs(last_timestamp):
                         tzinfo=timezone.utc
                     )
 
-                    if not last_timestamp or timestamp > last_timestamp:
+                    key = (timestamp, ip_address, int(port))
+                    seq = sequences.get(key, 0)
+                    sequences[key] = seq + 1
+
+                    # Same-second entries are kept; already stored ones hit the unique constraint.
+                    if not last_timestamp or timestamp >= last_timestamp:
                         entry = {
                             "timestamp": timestamp,
                             "ip_address": ip_address,
                             "port": int(port),
+                            "seq": seq,
                             "user": user
                         }
                         parsed_data.append(entry)
@@ -129,14 +141,15 @@ def insert_into_db(data):
 
             cursor.execute(
                 """
-                INSERT INTO failed_logins (timestamp, ip_address, port, city, region, country, latitude, longitude)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                ON CONFLICT (timestamp, ip_address, port) DO NOTHING;
+                INSERT INTO failed_logins (timestamp, ip_address, port, seq, city, region, country, latitude, longitude)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+                ON CONFLICT (timestamp, ip_address, port, seq) DO NOTHING;
                 """,
                 (
                     entry["timestamp"],
                     entry["ip_address"],
                     entry["port"],
+                    entry["seq"],
                     geo_data.get("city"),
                     geo_data.get("region"),
                     geo_data.get("country"),
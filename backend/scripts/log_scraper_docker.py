@@ -1,12 +1,22 @@
 import os
 import re
+import sys
+import json
+import signal
+import threading
+from collections import OrderedDict
 import psycopg2
+from psycopg2 import pool
 import requests
 import time
 from dotenv import load_dotenv
 from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 import logging
 
+from addresses import normalize_ip
+from burst_detector import BurstDetector
+
 # Load environment variables from .env
 load_dotenv()
 
@@ -25,7 +35,7 @@ LOG_PATTERN = (
     r".*?"                                       # skip everything until ...
     r"(?:Invalid user|Failed password for(?: invalid user)?) "
     r"(\S+) "                                    # group(2) -> username
-    r"from ([\d.]+) "                            # group(3) -> IP
+    r"from ([0-9A-Fa-f:.]+) "                    # group(3) -> IPv4 or IPv6
     r"port (\d+)"                                # group(4) -> port
 )
 # Geolocation API
@@ -36,58 +46,130 @@ GEO_API_FIELDS = "status,country,regionName,city,lat,lon"
 LOG_FILE = "/host_var_log/auth.log"
 CHECK_INTERVAL = 60  # Check every 60 seconds
 
+# Daemon mode settings
+POLL_INTERVAL = float(os.getenv("SCRAPER_POLL_INTERVAL", "0.5"))  # seconds between file checks
+BATCH_SIZE = int(os.getenv("SCRAPER_BATCH_SIZE", "50"))  # flush once this many entries are pending
+FLUSH_INTERVAL = float(os.getenv("SCRAPER_FLUSH_INTERVAL", "2"))  # or once the oldest pending entry is this old
+# Time allowed to start new inserts after SIGTERM; one slow geolocation lookup can still
+# overrun it, so it stays well under compose's stop_grace_period (30s)
+SHUTDOWN_FLUSH_SECONDS = float(os.getenv("SCRAPER_SHUTDOWN_FLUSH_SECONDS", "10"))
+HEALTH_PORT = int(os.getenv("SCRAPER_HEALTH_PORT", "8001"))
+SEQUENCE_CAPACITY = int(os.getenv("SCRAPER_SEQUENCE_CAPACITY", "100000"))  # recent (timestamp, ip, port) keys kept
+
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-def parse_new_logs(last_timestamp):
+def parse_line(line):
+    """Parse a single auth.log line into an entry dict, or None if it doesn't match."""
+    match = re.search(LOG_PATTERN, line)
+    if not match:
+        return None
+
+    timestamp_str = match.group(1)
+    user = match.group(2)
+    port = match.group(4)
+
+    ip_address = normalize_ip(match.group(3))
+    if ip_address is None:
+        logging.debug(f"Invalid IP address: {line.strip()}")
+        return None
+
+    # Mark if the line has "invalid user" in it
+    if "invalid user" in line:
+        user = f"Invalid:{user}"
+
+    # Convert "Feb  9 20:43:37" -> Python datetime
+    parsed_date = datetime.strptime(timestamp_str, "%b %d %H:%M:%S")
+    now = datetime.now()
+    year = now.year
+    # If log month is December but we're in early months of a new year,
+    # treat the entry as belonging to the previous year.
+    if parsed_date.month == 12 and now.month < 6:
+        year -= 1
+    timestamp = parsed_date.replace(year=year, tzinfo=timezone.utc)
+
+    return {
+        "timestamp": timestamp,
+        "ip_address": ip_address,
+        "port": int(port),
+        "user": user
+    }
+
+
+class SequenceNumbers:
+    """Numbers entries that share a (timestamp, ip_address, port) key 0, 1, 2, ... in log order.
+
+    sshd logs several failed passwords per connection, often in the same
+    second, so seq keeps them apart in the unique key. Numbering is
+    deterministic for a given file, so a re-read line gets the seq it was
+    stored with. The oldest keys are evicted past capacity.
+    """
+
+    def __init__(self, capacity=SEQUENCE_CAPACITY):
+        self.capacity = capacity
+        self.sequences = OrderedDict()  # (timestamp, ip_address, port) -> next seq
+
+    def next_seq(self, entry):
+        """Sequence number for the entry within its (timestamp, ip, port) second."""
+        key = (entry["timestamp"], entry["ip_address"], entry["port"])
+        seq = self.sequences.get(key, 0)
+        self.sequences[key] = seq + 1
+        self.sequences.move_to_end(key)
+        if len(self.sequences) > self.capacity:
+            self.sequences.popitem(last=False)
+        return seq
+
+
+def parse_lines(lines, last_timestamp=None, sequences=None):
+    """Parse an iterable of lines, keeping entries from last_timestamp onwards.
+
+    Entries in the same second as last_timestamp are kept; drop_stored()
+    removes the ones that are already in the table.
+    """
+    if sequences is None:
+        sequences = SequenceNumbers()
+    parsed_data = []
+
+    for line in lines:
+        entry = parse_line(line)
+        if entry is None:
+            logging.debug(f"No match: {line.strip()}")
+            continue
+        entry["seq"] = sequences.next_seq(entry)
+
+        if not last_timestamp or entry["timestamp"] >= last_timestamp:
+            parsed_data.append(entry)
+            logging.info(f"New log entry: {entry}")
+        else:
+            logging.debug(f"Skipping already processed: {entry['timestamp']}")
+
+    return parsed_data
+
+
+def drop_stored(entries, last_timestamp, stored_keys):
+    """Drop entries from the last stored second whose (ip_address, port, seq) is already stored.
+
+    Re-read lines are skipped here, before they cost a geolocation lookup
+    and an insert that the unique constraint would reject anyway.
+    """
+    return [
+        entry for entry in entries
+        if entry["timestamp"] != last_timestamp
+        or (entry["ip_address"], entry["port"], entry["seq"]) not in stored_keys
+    ]
+
+
+def parse_new_logs(last_timestamp, stored_keys=frozenset()):
     parsed_data = []
-    line_number = 0
 
     try:
         with open(LOG_FILE, "r") as file:
-            for line in file:
-                line_number += 1
-                match = re.search(LOG_PATTERN, line)
-                if match:
-                    timestamp_str = match.group(1)
-                    user = match.group(2)
-                    ip_address = match.group(3)
-                    port = match.group(4)
-
-                    # Mark if the line has "invalid user" in it
-                    if "invalid user" in line:
-                        user = f"Invalid:{user}"
-
-                    # Convert "Feb  9 20:43:37" -> Python datetime
-                    parsed_date = datetime.strptime(timestamp_str, "%b %d %H:%M:%S")
-                    now = datetime.now()
-                    year = now.year
-                    # If log month is December but we're in early months of a new year,
-                    # treat the entry as belonging to the previous year.
-                    if parsed_date.month == 12 and now.month < 6:
-                        year -= 1
-                    timestamp = parsed_date.replace(year=year, tzinfo=timezone.utc)
-
-                    if not last_timestamp or timestamp > last_timestamp:
-                        entry = {
-                            "timestamp": timestamp,
-                            "ip_address": ip_address,
-                            "port": int(port),
-                            "user": user
-                        }
-                        parsed_data.append(entry)
-
-                        logging.info(f"New log entry: {entry}")
-                    else:
-                        logging.debug(f"Skipping already processed: {timestamp_str}")
-                else:
-                    logging.debug(f"No match: {line.strip()}")
+            parsed_data = drop_stored(parse_lines(file, last_timestamp), last_timestamp, stored_keys)
     except FileNotFoundError:
         logging.error(f"Log file not found: {LOG_FILE}")
 
     return parsed_data
 
 
-
 def resolve_geolocation(ip_address):
     """Resolve geolocation information for an IP address with retries."""
     retries = 3
@@ -119,10 +201,32 @@ def resolve_geolocation(ip_address):
     return {}
 
 
-def insert_into_db(data):
-    """Insert data into the database."""
-    conn = psycopg2.connect(**DB_CONFIG)
+def insert_alerts(cursor, alerts):
+    """Record burst alerts; the API pushes new rows to WebSocket clients."""
+    for alert in alerts:
+        cursor.execute(
+            """
+            INSERT INTO alerts (window_start, dimension, key, count, baseline)
+            VALUES (%(window_start)s, %(dimension)s, %(key)s, %(count)s, %(baseline)s)
+            ON CONFLICT (dimension, key, window_start) DO NOTHING;
+            """,
+            alert,
+        )
+
+
+def insert_into_db(data, conn=None, detector=None):
+    """Insert data into the database.
+
+    If a connection is passed in it is reused and left open, otherwise a
+    one-off connection is opened and closed around the batch. Newly stored
+    rows are fed to the burst detector, if given, and its alerts are stored
+    in the same transaction.
+    """
+    owns_conn = conn is None
+    if owns_conn:
+        conn = psycopg2.connect(**DB_CONFIG)
     cursor = conn.cursor()
+    inserted = 0
 
     for entry in data:
         try:
@@ -131,14 +235,15 @@ def insert_into_db(data):
 
             cursor.execute(
                 """
-                INSERT INTO failed_logins (timestamp, ip_address, port, city, region, country, latitude, longitude)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-                ON CONFLICT (timestamp, ip_address, port) DO NOTHING;
+                INSERT INTO failed_logins (timestamp, ip_address, port, seq, city, region, country, latitude, longitude)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+                ON CONFLICT (timestamp, ip_address, port, seq) DO NOTHING;
                 """,
                 (
                     entry["timestamp"],
                     entry["ip_address"],
                     entry["port"],
+                    entry.get("seq", 0),
                     geo_data.get("city"),
                     geo_data.get("region"),
                     geo_data.get("country"),
@@ -146,35 +251,308 @@ def insert_into_db(data):
                     geo_data.get("longitude"),
                 ),
             )
+            stored = cursor.rowcount
+            if stored and detector is not None:
+                insert_alerts(cursor, detector.observe(entry, geo_data))
             conn.commit()
+            inserted += stored
             print(f"Inserted entry: {entry}")
             logging.info(f"Inserted entry: {entry}")
         except Exception as e:
             logging.info(f"Error inserting entry {entry}: {e}")
             print(f"Error inserting entry {entry}: {e}")
             conn.rollback()
+            if conn.closed:
+                raise
 
     cursor.close()
-    conn.close()
+    if owns_conn:
+        conn.close()
+    return inserted
 
 
-def get_last_processed_timestamp():
+def get_last_processed_timestamp(conn=None):
     """Retrieve the most recent timestamp processed."""
-    conn = psycopg2.connect(**DB_CONFIG)
+    owns_conn = conn is None
+    if owns_conn:
+        conn = psycopg2.connect(**DB_CONFIG)
     cursor = conn.cursor()
     cursor.execute("SELECT MAX(timestamp) FROM failed_logins;")
     result = cursor.fetchone()
     cursor.close()
-    conn.close()
+    if owns_conn:
+        conn.close()
+    else:
+        conn.commit()
     return result[0].replace(tzinfo=timezone.utc) if result[0] else None
 
 
+def get_stored_keys(timestamp, conn=None):
+    """(ip_address, port, seq) of the rows stored at timestamp."""
+    if timestamp is None:
+        return set()
+    owns_conn = conn is None
+    if owns_conn:
+        conn = psycopg2.connect(**DB_CONFIG)
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT host(ip_address), port, seq FROM failed_logins WHERE timestamp = %s;",
+        (timestamp,),
+    )
+    keys = set(cursor.fetchall())
+    cursor.close()
+    if owns_conn:
+        conn.close()
+    else:
+        conn.commit()
+    return keys
+
+
+class LogTailer:
+    """Follow LOG_FILE by polling, surviving rotation and truncation.
+
+    The file is stat'ed every POLL_INTERVAL; new complete lines since the
+    last read offset are returned. A changed inode or a file that shrank
+    means logrotate ran, so reading restarts from the top of the new file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+        self.inode = None
+        self.partial = b""
+
+    def _open(self):
+        try:
+            self.file = open(self.path, "rb")
+        except FileNotFoundError:
+            self.file = None
+            return False
+        self.inode = os.fstat(self.file.fileno()).st_ino
+        self.partial = b""
+        return True
+
+    def _rotated(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return False
+        return st.st_ino != self.inode or st.st_size < self.file.tell()
+
+    def read_new_lines(self):
+        """Return complete lines appended since the last call."""
+        if self.file is None and not self._open():
+            return []
+
+        lines = []
+        if self._rotated():
+            # Drain whatever was left in the old file before switching over.
+            lines.extend(self._read_available())
+            self.file.close()
+            logging.info(f"Log file rotated, reopening {self.path}")
+            if not self._open():
+                return lines
+
+        lines.extend(self._read_available())
+        return lines
+
+    def _read_available(self):
+        data = self.file.read()
+        if not data:
+            return []
+        data = self.partial + data
+        raw_lines = data.split(b"\n")
+        # The last element is an incomplete line (or b"" if data ended in a newline).
+        self.partial = raw_lines.pop()
+        return [raw.decode("utf-8", errors="replace") for raw in raw_lines]
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class ScraperDaemon:
+    """Long-running scraper: tails the log, batches entries and inserts them."""
+
+    def __init__(self):
+        self.db_pool = None
+        self.tailer = LogTailer(LOG_FILE)
+        self.sequences = SequenceNumbers()
+        self.detector = BurstDetector()
+        self.pending = []
+        self.pending_since = None
+        self.stop_event = threading.Event()
+        self.shutdown_deadline = None
+        self.status = {
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "last_flush": None,
+            "last_error": None,
+            "lines_read": 0,
+            "entries_inserted": 0,
+            "duplicates_skipped": 0,
+            "pending": 0,
+            "db_connected": False,
+        }
+
+    def _connect(self):
+        """(Re)create the connection pool, retrying until the DB is reachable."""
+        while not self.stop_event.is_set():
+            try:
+                self.db_pool = pool.SimpleConnectionPool(minconn=1, maxconn=2, **DB_CONFIG)
+                self.status["db_connected"] = True
+                return
+            except psycopg2.OperationalError as e:
+                self.status["db_connected"] = False
+                self.status["last_error"] = str(e)
+                logging.error(f"Database unavailable, retrying in 5s: {e}")
+                self.stop_event.wait(5)
+
+    def _catch_up(self):
+        """Import everything newer than the last stored timestamp, then start tailing."""
+        conn = self.db_pool.getconn()
+        try:
+            last_timestamp = get_last_processed_timestamp(conn)
+            stored_keys = get_stored_keys(last_timestamp, conn)
+        finally:
+            self.db_pool.putconn(conn)
+
+        entries = parse_lines(self.tailer.read_new_lines(), last_timestamp, self.sequences)
+        new_entries = drop_stored(entries, last_timestamp, stored_keys)
+        self.status["duplicates_skipped"] += len(entries) - len(new_entries)
+        logging.info(f"Catch-up found {len(new_entries)} new log entries.")
+        self._queue(new_entries)
+
+    def _queue(self, entries):
+        if entries and not self.pending:
+            self.pending_since = time.monotonic()
+        self.pending.extend(entries)
+        self.status["pending"] = len(self.pending)
+
+    def _out_of_time(self):
+        return self.shutdown_deadline is not None and time.monotonic() >= self.shutdown_deadline
+
+    def flush(self):
+        """Insert up to BATCH_SIZE pending entries using a pooled connection.
+
+        Rows are inserted one at a time (each needs a rate-limited geolocation
+        lookup), and after SIGTERM the chunk is abandoned once the shutdown
+        deadline passes. Anything left over is re-read from the log on restart.
+        """
+        if not self.pending:
+            return
+
+        chunk = self.pending[:BATCH_SIZE]
+        processed = 0
+        conn = self.db_pool.getconn()
+        try:
+            for entry in chunk:
+                if self._out_of_time():
+                    break
+                self.status["entries_inserted"] += insert_into_db([entry], conn, self.detector)
+                processed += 1
+            self.status["last_flush"] = datetime.now(timezone.utc).isoformat()
+            self.db_pool.putconn(conn)
+        except psycopg2.Error as e:
+            # Connection died mid-chunk: keep the unprocessed entries and reconnect.
+            self.status["db_connected"] = False
+            self.status["last_error"] = str(e)
+            logging.error(f"Database error during flush: {e}")
+            self.db_pool.putconn(conn, close=True)
+            self.db_pool.closeall()
+            if not self.stop_event.is_set():
+                self._connect()
+
+        del self.pending[:processed]
+        self.pending_since = time.monotonic() if self.pending else None
+        self.status["pending"] = len(self.pending)
+
+    def _should_flush(self):
+        if not self.pending:
+            return False
+        if len(self.pending) >= BATCH_SIZE:
+            return True
+        return time.monotonic() - self.pending_since >= FLUSH_INTERVAL
+
+    def stop(self, *_):
+        logging.info(f"Shutdown requested, flushing pending entries for up to {SHUTDOWN_FLUSH_SECONDS:.0f}s...")
+        self.shutdown_deadline = time.monotonic() + SHUTDOWN_FLUSH_SECONDS
+        self.stop_event.set()
+
+    def run(self):
+        self._connect()
+        if self.stop_event.is_set():
+            return
+        self._catch_up()
+
+        while not self.stop_event.is_set():
+            lines = self.tailer.read_new_lines()
+            if lines:
+                self.status["lines_read"] += len(lines)
+                self._queue(parse_lines(lines, sequences=self.sequences))
+            if self._should_flush():
+                self.flush()
+            self.stop_event.wait(POLL_INTERVAL)
+
+        # Graceful shutdown: pick up anything written since the last poll, then
+        # keep flushing until the pending entries or the shutdown deadline run out.
+        self._queue(parse_lines(self.tailer.read_new_lines(), sequences=self.sequences))
+        while self.pending and self.status["db_connected"] and not self._out_of_time():
+            self.flush()
+        if self.pending:
+            logging.error(f"Exiting with {len(self.pending)} unflushed entries; they will be re-read on restart.")
+        self.tailer.close()
+        if not self.db_pool.closed:
+            self.db_pool.closeall()
+        logging.info("Log scraper daemon stopped.")
+
+
+def start_health_server(daemon):
+    """Serve daemon status as JSON on /healthz in a background thread."""
+
+    class HealthHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path not in ("/healthz", "/status"):
+                self.send_error(404)
+                return
+            healthy = daemon.status["db_connected"] and not daemon.stop_event.is_set()
+            body = json.dumps({"status": "ok" if healthy else "degraded", **daemon.status}).encode()
+            self.send_response(200 if healthy else 503)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logging.debug(format % args)
+
+    server = ThreadingHTTPServer(("0.0.0.0", HEALTH_PORT), HealthHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def run_daemon():
+    daemon = ScraperDaemon()
+    signal.signal(signal.SIGTERM, daemon.stop)
+    signal.signal(signal.SIGINT, daemon.stop)
+    server = start_health_server(daemon)
+    print(f"Starting log scraper daemon (health on :{HEALTH_PORT})...")
+    try:
+        daemon.run()
+    finally:
+        server.shutdown()
+
+
 if __name__ == "__main__":
+    if "--daemon" in sys.argv:
+        run_daemon()
+        sys.exit(0)
+
     print("Starting log scraper...")
 
     try:
         last_timestamp = get_last_processed_timestamp()
-        new_logs = parse_new_logs(last_timestamp)
+        new_logs = parse_new_logs(last_timestamp, get_stored_keys(last_timestamp))
         print(f"Found {len(new_logs)} new log entries.")
 
         if new_logs:
@@ -7,6 +7,8 @@ import time
 from datetime import datetime, timezone
 import logging
 
+from addresses import normalize_ip
+
 # Load environment variables from .env
 #load_dotenv()
 
@@ -25,7 +27,7 @@ LOG_PATTERN = (
     r".*?"                                       # skip everything until ...
     r"(?:Invalid user|Failed password for(?: invalid user)?) "
     r"(\S+) "                                    # group(2) -> username
-    r"from ([\d.]+) "                            # group(3) -> IP
+    r"from ([0-9A-Fa-f:.]+) "                    # group(3) -> IPv4 or IPv6
     r"port (\d+)"                                # group(4) -> port
 )
 # Geolocation API
@@ -49,8 +51,11 @@ def parse_new_logs(last_timestamp):
                 if match:
                     timestamp_str = match.group(1)
                     user = match.group(2)
-                    ip_address = match.group(3)
+                    ip_address = normalize_ip(match.group(3))
                     port = match.group(4)
+                    if ip_address is None:
+                        logging.debug(f"Invalid IP address: {line.strip()}")
+                        continue
 
                     # Mark if the line has "invalid user" in it
                     if "invalid user" in line:
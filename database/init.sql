@@ -7,18 +7,52 @@ SELECT pg_reload_conf();
 CREATE TABLE IF NOT EXISTS failed_logins (
     id SERIAL PRIMARY KEY,
     timestamp TIMESTAMPTZ NOT NULL,
-    ip_address VARCHAR(45) NOT NULL,
+    ip_address INET NOT NULL,
     port INTEGER NOT NULL,
+    seq SMALLINT NOT NULL DEFAULT 0,  -- distinguishes distinct events in the same second
     city VARCHAR(255),
     region VARCHAR(255),
     country VARCHAR(255),
     latitude FLOAT,
     longitude FLOAT,
     attempts INTEGER DEFAULT 1,
-    CONSTRAINT unique_failed_login UNIQUE (timestamp, ip_address, port)
+    CONSTRAINT unique_failed_login UNIQUE (timestamp, ip_address, port, seq)
 );
 
 -- Create indexes
-CREATE INDEX IF NOT EXISTS idx_ip_address ON failed_logins (ip_address);
+-- GiST supports subnet containment (<<=, >>=) as well as equality
+CREATE INDEX IF NOT EXISTS idx_ip_address ON failed_logins USING gist (ip_address inet_ops);
 CREATE INDEX IF NOT EXISTS idx_timestamp ON failed_logins (timestamp);
-CREATE INDEX IF NOT EXISTS idx_city_timestamp ON failed_logins (city, timestamp DESC);
\ No newline at end of file
+CREATE INDEX IF NOT EXISTS idx_city_timestamp ON failed_logins (city, timestamp DESC);
+
+-- Bursts flagged by the scraper's streaming detector
+CREATE TABLE IF NOT EXISTS alerts (
+    id SERIAL PRIMARY KEY,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    window_start TIMESTAMPTZ NOT NULL,
+    dimension VARCHAR(16) NOT NULL,  -- country, subnet or port
+    key VARCHAR(255) NOT NULL,
+    count INTEGER NOT NULL,
+    baseline FLOAT NOT NULL,
+    CONSTRAINT unique_alert UNIQUE (dimension, key, window_start)
+);
+
+
+-- Hourly attempt counts for rows moved out of failed_logins by the archiver.
+-- country is '' when unknown so it can be part of the primary key.
+CREATE TABLE IF NOT EXISTS failed_logins_rollup (
+    bucket TIMESTAMPTZ NOT NULL,
+    country VARCHAR(255) NOT NULL,
+    port INTEGER NOT NULL,
+    attempts BIGINT NOT NULL,
+    PRIMARY KEY (bucket, country, port)
+);
+
+-- Hourly counts over hot and archived rows; charts read this so archiving keeps totals intact.
+CREATE OR REPLACE VIEW attack_counts AS
+    SELECT date_trunc('hour', timestamp) AS bucket, country, port, SUM(COALESCE(attempts, 1)) AS attempts
+    FROM failed_logins
+    GROUP BY 1, 2, 3
+    UNION ALL
+    SELECT bucket, NULLIF(country, ''), port, attempts
+    FROM failed_logins_rollup;
@@ -4,6 +4,21 @@ import Logs from "./components/Logs";
 import ChartSection from "./components/ChartSection";
 import "./App.css";
 
+const MAP_LOG_LIMIT = 100;
+const MAP_LOGS_PER_CITY = 2;
+
+// Same shape as /maplogs/: newest first, known cities only, at most 2 per city
+const limitMapLogs = (logs) => {
+  const cityCounts = {};
+  return logs
+    .filter((log) => {
+      if (!log.city) return false;
+      cityCounts[log.city] = (cityCounts[log.city] || 0) + 1;
+      return cityCounts[log.city] <= MAP_LOGS_PER_CITY;
+    })
+    .slice(0, MAP_LOG_LIMIT);
+};
+
 function App() {
   const [logs, setLogs] = useState([]);
   const [maplogs, setMapLogs] = useState([]);
@@ -34,14 +49,23 @@ function App() {
         : "ws://127.0.0.1:8000/ws/maplogs"
     );
 
+    // Ask for deltas only: new geolocated attacks since now, instead of full snapshots
+    ws.onopen = () => {
+      ws.send(JSON.stringify({ type: "subscribe", filters: { bbox: [-90, -180, 90, 180] } }));
+    };
+
     ws.onmessage = (event) => {
       const message = JSON.parse(event.data);
 
-      if (message.type === "logs") {
+      if (message.type === "delta") {
         const newLogs = message.data;
 
         // Limit logs and map logs to reduce load
-        setMapLogs((prevMapLogs) => [...newLogs, ...prevMapLogs].slice(0, 100));
+        setMapLogs((prevMapLogs) => limitMapLogs([...newLogs, ...prevMapLogs]));
+      } else if (message.type === "snapshot" || message.type === "logs") {
+        setMapLogs(limitMapLogs(message.data));
+      } else if (message.type === "alert") {
+        console.warn("Attack burst detected:", message.data);
       } else if (message.type === "ping") {
         console.log("Keep-alive ping received");
       }